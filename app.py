@@ -2,14 +2,31 @@
 AI Tutor Chatbot - Main Streamlit Application
 Interactive chatbot for learning with PDF documents
 """
+import functools
+import hashlib
 import os
+import re
+import threading
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 from pathlib import Path
-from src.config import PAGE_TITLE, PAGE_ICON, UPLOAD_DIRECTORY, MAX_FILE_SIZE_MB
+from src.config import (
+    PAGE_TITLE,
+    PAGE_ICON,
+    UPLOAD_DIRECTORY,
+    MAX_FILE_SIZE_MB,
+    UPLOAD_WRITE_CHUNK_BYTES,
+    EXACT_CACHE_MAX_ENTRIES,
+    WARMUP_QUERIES
+)
 from src.document_processor import DocumentProcessor
-from src.vector_store import VectorStoreManager
+from src.vector_store import VectorStoreManager, cached_query_embedder, create_embeddings
 from src.llm_handler import LLMHandler
 
+# Prompt classifiers, compiled once and matched on whole words
+_WIDE_RE = re.compile(r"\b(all|list|laws|chapter|rules)\b", re.I)
+# "summary" or any form of summarize/summarise ("summarized", "summarizing", ...)
+_SUM_RE = re.compile(r"\bsummar(y|i[sz]\w*)\b", re.I)
 
 # Page configuration
 st.set_page_config(
@@ -38,15 +55,66 @@ if "current_file" not in st.session_state:
 if "loaded_files" not in st.session_state:
     st.session_state.loaded_files = []  # Track all loaded files
 
+if "last_chunk_count" not in st.session_state:
+    st.session_state.last_chunk_count = 0
+
+if "exact_cache" not in st.session_state:
+    st.session_state.exact_cache = {}  # (prompt, current_file) -> (docs, response)
+
+if "indexing_job" not in st.session_state:
+    st.session_state.indexing_job = None  # Background PDF indexing still to be reported
+
+
+@st.cache_resource
+def get_embeddings():
+    """Load the embeddings model once per server process, shared by all sessions"""
+    return create_embeddings()
+
+
+@st.cache_resource
+def get_query_embedder():
+    """LRU-cached query embedder shared by vector search and the semantic cache"""
+    return cached_query_embedder(get_embeddings())
+
+
+@st.cache_resource
+def get_doc_processor():
+    """Shared document processor"""
+    return DocumentProcessor()
+
+
+@st.cache_resource
+def get_llm_handler(api_key: str):
+    """Shared LLM handler per API key"""
+    return LLMHandler(api_key=api_key, embed_query=get_query_embedder())
+
+
+@st.cache_resource(show_spinner="Loading models...")
+def warmup():
+    """
+    Load and exercise the embeddings model once at server start
+    so the first user query doesn't pay for model loading
+    """
+    embeddings = get_embeddings()
+    embeddings.embed_documents(WARMUP_QUERIES)
+    
+    # Read any persisted index once so session loads hit the OS page cache
+    vector_store = VectorStoreManager(embeddings=embeddings, embed_query=get_query_embedder())
+    vector_store.similarity_search(WARMUP_QUERIES[0], k=1)
+    return True
+
 
 def initialize_components(api_key: str):
     """Initialize vector store and LLM handler"""
     try:
         if st.session_state.vector_store is None:
-            st.session_state.vector_store = VectorStoreManager()
+            st.session_state.vector_store = VectorStoreManager(
+                embeddings=get_embeddings(),
+                embed_query=get_query_embedder()
+            )
         
         if st.session_state.llm_handler is None:
-            st.session_state.llm_handler = LLMHandler(api_key=api_key)
+            st.session_state.llm_handler = get_llm_handler(api_key)
         
         return True
     except Exception as e:
@@ -54,49 +122,160 @@ def initialize_components(api_key: str):
         return False
 
 
+def save_upload(uploaded_file, file_path: str):
+    """Write an uploaded file to disk in fixed-size chunks, showing progress"""
+    total = uploaded_file.size or 1
+    written = 0
+    progress = st.progress(0.0, text=f"Saving {uploaded_file.name}...")
+    
+    uploaded_file.seek(0)
+    with open(file_path, "wb") as f:
+        while chunk := uploaded_file.read(UPLOAD_WRITE_CHUNK_BYTES):
+            f.write(chunk)
+            written += len(chunk)
+            progress.progress(min(written / total, 1.0), text=f"Saving {uploaded_file.name}...")
+    
+    progress.empty()
+
+
+def run_in_thread(fn):
+    """
+    Run fn on a background thread attached to the current script run
+    The wrapper returns (done, result): done is set when fn finishes,
+    and result then holds either "value" or "error"
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        done = threading.Event()
+        result = {}
+        
+        def target():
+            try:
+                result["value"] = fn(*args, **kwargs)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                done.set()
+        
+        thread = threading.Thread(target=target, daemon=True)
+        add_script_run_ctx(thread)
+        thread.start()
+        return done, result
+    
+    return wrapper
+
+
+@run_in_thread
+def index_pdf(vector_store, file_path: str, filename: str, file_hash: str, status: dict) -> int:
+    """Extract, chunk and embed a PDF, reporting progress through status"""
+    status.update(stage="Extracting text...", progress=0.1)
+    chunks = get_doc_processor().process_pdf(file_path, filename)
+    
+    status.update(stage=f"Embedding {len(chunks)} chunks...", progress=0.5)
+    if not vector_store.add_documents(chunks, key=file_hash):
+        raise RuntimeError("Failed to add documents to vector store")
+    
+    status.update(stage="Done", progress=1.0)
+    return len(chunks)
+
+
+def mark_loaded(filename: str):
+    """Record a file as loaded and available for chat"""
+    st.session_state.documents_loaded = True
+    st.session_state.current_file = filename
+    # The store changed, so earlier answers may be stale
+    st.session_state.exact_cache = {}
+    # Add to loaded files list if not already there
+    if filename not in st.session_state.loaded_files:
+        st.session_state.loaded_files.append(filename)
+
+
 def process_pdf(uploaded_file, api_key):
     """Process uploaded PDF file"""
     try:
+        # Initialize components
+        if not initialize_components(api_key):
+            return False
+        
+        # Identical bytes were processed before: reuse the saved index
+        file_hash = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+        if st.session_state.vector_store.load(file_hash):
+            mark_loaded(uploaded_file.name)
+            st.success(f"✅ Loaded previously processed {uploaded_file.name}")
+            return True
+        
         # Ensure upload directory exists
         os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
         
         # Save uploaded file
         file_path = os.path.join(UPLOAD_DIRECTORY, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        save_upload(uploaded_file, file_path)
         
-        # Initialize components
-        if not initialize_components(api_key):
-            return False
-        
-        # Process document
-        with st.spinner("Processing PDF... This may take a moment."):
-            doc_processor = DocumentProcessor()
-            chunks = doc_processor.process_pdf(file_path, uploaded_file.name)
-            
-            # Add to vector store
-            success = st.session_state.vector_store.add_documents(chunks)
-            
-            if success:
-                st.session_state.documents_loaded = True
-                st.session_state.current_file = uploaded_file.name
-                # Add to loaded files list if not already there
-                if uploaded_file.name not in st.session_state.loaded_files:
-                    st.session_state.loaded_files.append(uploaded_file.name)
-                st.success(f"✅ Successfully processed {len(chunks)} chunks from {uploaded_file.name}")
-                return True
-            else:
-                st.error("Failed to add documents to vector store")
-                return False
+        # Process document off the script thread so progress keeps rendering
+        status = {"stage": "Starting...", "progress": 0.0}
+        done, result = index_pdf(
+            st.session_state.vector_store,
+            file_path,
+            uploaded_file.name,
+            file_hash,
+            status
+        )
+        # Kept in session state so a rerun mid-indexing can still finish the job
+        st.session_state.indexing_job = {
+            "done": done,
+            "result": result,
+            "status": status,
+            "filename": uploaded_file.name
+        }
+        return finish_indexing()
                 
     except Exception as e:
         st.error(f"Error processing PDF: {e}")
         return False
 
 
+def finish_indexing():
+    """
+    Show progress for the background indexing job until it completes, then report it
+    Called on every script run, since widget interaction can rerun the script mid-job
+    Returns True if the job succeeded
+    """
+    job = st.session_state.indexing_job
+    if job is None:
+        return False
+    
+    progress = st.progress(job["status"]["progress"], text=job["status"]["stage"])
+    while not job["done"].wait(0.1):
+        progress.progress(job["status"]["progress"], text=job["status"]["stage"])
+    progress.empty()
+    
+    st.session_state.indexing_job = None
+    result = job["result"]
+    if "error" in result:
+        st.error(f"Error processing PDF: {result['error']}")
+        return False
+    
+    st.session_state.last_chunk_count = result["value"]
+    mark_loaded(job["filename"])
+    st.success(f"✅ Successfully processed {st.session_state.last_chunk_count} chunks from {job['filename']}")
+    return True
+
+
+def render_sources(docs):
+    """Show the retrieved chunks behind an answer"""
+    if docs:
+        with st.expander("📚 View Sources"):
+            for i, doc in enumerate(docs, 1):
+                st.markdown(f"**Source {i}:** {doc.metadata.get('source', 'Unknown')}")
+                st.text(doc.page_content[:300] + "...")
+                st.divider()
+
+
 def main():
     """Main application"""
     
+    warmup()
+    
     # Header
     st.title(f"{PAGE_ICON} AI Tutor - Smart Learning Assistant")
     st.markdown("Upload your lecture notes, textbooks, or study materials and chat with them!")
@@ -126,10 +305,15 @@ def main():
             help=f"Maximum file size: {MAX_FILE_SIZE_MB}MB"
         )
         
+        indexing = st.session_state.indexing_job is not None
         if uploaded_file and api_key:
-            if st.button("Process PDF", type="primary"):
+            if st.button("Process PDF", type="primary", disabled=indexing):
                 process_pdf(uploaded_file, api_key)
         
+        # Pick up a job whose original run was interrupted by a rerun
+        if indexing:
+            finish_indexing()
+        
         # Show loaded files
         if st.session_state.loaded_files:
             st.header("📚 Loaded Documents")
@@ -182,6 +366,7 @@ def main():
                 st.session_state.current_file = None
                 st.session_state.loaded_files = []  # Clear loaded files list
                 st.session_state.messages = []
+                st.session_state.exact_cache = {}
                 st.success("All documents cleared!")
                 st.rerun()
     
@@ -229,65 +414,64 @@ def main():
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    # Check if this is a summary request
-                    is_summary = "summary" in prompt.lower() or "summarize" in prompt.lower()
-                    
-                    # Check if this is an explain request
-                    is_explain = prompt.lower().startswith("explain:") or prompt.lower().startswith("explain ")
-                    
-                    # Check for specific queries that need more context
-                    needs_more_context = any([
-                        "all" in prompt.lower(),
-                        "list" in prompt.lower(),
-                        "laws" in prompt.lower(),
-                        "chapter" in prompt.lower(),
-                        "rules" in prompt.lower()
-                    ])
+                    # Identical prompt against the same document: skip search and LLM
+                    exact_cache = st.session_state.exact_cache
+                    cache_key = (prompt, st.session_state.current_file)
+                    cached = exact_cache.get(cache_key)
                     
-                    # Get more documents for summary or comprehensive queries
-                    k = 10 if (is_summary or needs_more_context) else 5
-                    
-                    # Expand query for better search
-                    search_query = prompt
-                    # Handle "1%" searches by also searching for variations
-                    if "1%" in prompt or "one percent" in prompt.lower():
-                        search_query = prompt + " improvement tiny gains marginal"
-                    
-                    # Get retriever
-                    retriever = st.session_state.vector_store.get_retriever(k=k)
-                    
-                    if retriever:
-                        # Get relevant documents
-                        docs = st.session_state.vector_store.similarity_search(search_query, k=k)
+                    if cached is not None:
+                        docs, response = cached
+                        st.markdown(response)
+                        render_sources(docs)
+                    else:
+                        # Check if this is a summary request
+                        is_summary = bool(_SUM_RE.search(prompt))
                         
-                        # Generate response with context
-                        if is_summary:
-                            # For summaries, get all document text
-                            all_text = "\n\n".join([doc.page_content for doc in docs])
-                            response = st.session_state.llm_handler.summarize_text(all_text)
-                        elif is_explain:
-                            # For term explanations, extract the term and get context
-                            term = prompt.replace("explain:", "").replace("Explain:", "").replace("explain", "", 1).strip()
-                            context = "\n\n".join([doc.page_content for doc in docs[:3]])
-                            response = st.session_state.llm_handler.explain_term(term, context)
-                        else:
-                            response = st.session_state.llm_handler.chat_with_context(
-                                prompt, 
-                                docs
-                            )
+                        # Check if this is an explain request
+                        is_explain = prompt.lower().startswith(("explain:", "explain "))
                         
-                        st.markdown(response)
+                        # Check for specific queries that need more context
+                        needs_more_context = bool(_WIDE_RE.search(prompt))
                         
-                        # Show sources
-                        if docs:
-                            with st.expander("📚 View Sources"):
-                                for i, doc in enumerate(docs, 1):
-                                    st.markdown(f"**Source {i}:** {doc.metadata.get('source', 'Unknown')}")
-                                    st.text(doc.page_content[:300] + "...")
-                                    st.divider()
-                    else:
-                        response = "I don't have any documents loaded yet. Please upload a PDF first."
-                        st.markdown(response)
+                        # Get more documents for summary or comprehensive queries
+                        k = 10 if (is_summary or needs_more_context) else 5
+                        
+                        # Expand query for better search
+                        search_query = prompt
+                        # Handle "1%" searches by also searching for variations
+                        if "1%" in prompt or "one percent" in prompt.lower():
+                            search_query = prompt + " improvement tiny gains marginal"
+                        
+                        if st.session_state.vector_store.vectorstore is not None:
+                            # Get relevant documents
+                            docs = st.session_state.vector_store.similarity_search(search_query, k=k)
+                            
+                            # Generate response with context, streaming tokens as they arrive
+                            if is_summary:
+                                # For summaries, get all document text
+                                all_text = "\n\n".join([doc.page_content for doc in docs])
+                                stream = st.session_state.llm_handler.summarize_text_stream(all_text)
+                            elif is_explain:
+                                # For term explanations, extract the term and get context
+                                term = prompt.replace("explain:", "").replace("Explain:", "").replace("explain", "", 1).strip()
+                                context = "\n\n".join([doc.page_content for doc in docs[:3]])
+                                stream = st.session_state.llm_handler.explain_term_stream(term, context)
+                            else:
+                                stream = st.session_state.llm_handler.chat_with_context_stream(
+                                    prompt, 
+                                    docs
+                                )
+                            response = st.write_stream(stream)
+                            
+                            render_sources(docs)
+                            
+                            # Remember answers for identical prompts; a failed stream raises before this
+                            exact_cache[cache_key] = (docs, response)
+                            while len(exact_cache) > EXACT_CACHE_MAX_ENTRIES:
+                                exact_cache.pop(next(iter(exact_cache)))
+                        else:
+                            response = "I don't have any documents loaded yet. Please upload a PDF first."
+                            st.markdown(response)
                     
                     # Add assistant response to chat
                     st.session_state.messages.append({"role": "assistant", "content": response})
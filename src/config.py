@@ -11,14 +11,41 @@ HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 
 # Model Settings
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = 64  # Chunks per MiniLM forward pass during ingest
+EMBED_MAX_SEQ_LENGTH = 256  # Tokens per chunk seen by MiniLM (sentence-transformers default)
+EMBED_TOKEN_BUDGET = 8192  # Padded tokens per length-sorted ingest batch
+ONNX_MODEL_DIRECTORY = "./data/onnx_model"  # Exported int8 embedding model for CPU hosts
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # Recent query vectors kept per vector store
+WARMUP_QUERIES = ["summarize this", "explain this term", "list all the"]
 LLM_MODEL = "google/flan-t5-base"  # Reliable free model via HuggingFace Inference API
 
 # FAISS Settings
 FAISS_PERSIST_DIRECTORY = "./data/faiss_db"
+# Corpora at least this large are stored as IVF-PQ (48 bytes/vector) instead of a flat index
+IVF_PQ_MIN_VECTORS = 10_000
+IVF_NLIST = 64
+IVF_NPROBE = 8
+PQ_M = 48  # Sub-quantizers; must divide the embedding dimension (384)
+SQ8_MIN_TRAIN_VECTORS = 1_000  # Smaller HNSW stores stay unquantized; SQ8 ranges need a representative sample
+IVF_TRAIN_SAMPLE = 50_000  # Vectors sampled to train the IVF-PQ quantizers
+RERANK_LENGTH_PENALTY = 0.01  # Score penalty per log(chunk length) in reranked search
+# efSearch values timed per store so searches can fit a caller's latency budget
+EF_SEARCH_CANDIDATES = [32, 64, 128, 256, 512]
+EF_BENCHMARK_QUERIES = 200
 
 # Document Processing Settings
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+# Smaller PDFs are extracted serially. Pages take ~150 ms each, and the worker pool's first
+# start re-imports app.py in every worker (~2 s), which 4 cores win back only after ~20 pages
+PARALLEL_EXTRACTION_MIN_PAGES = 32
+
+# Semantic Cache Settings
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Cosine similarity needed to reuse an answer
+SEMANTIC_CACHE_MAX_ENTRIES = 512
+SEMANTIC_CACHE_TTL_SECONDS = 15 * 60
+SEMANTIC_CACHE_PATH = "./data/sem_cache.pkl"
+EXACT_CACHE_MAX_ENTRIES = 128  # Per-session cache of identical prompts
 
 # Streamlit Settings
 PAGE_TITLE = "AI Tutor - Smart Learning Assistant"
@@ -27,3 +54,4 @@ PAGE_ICON = "📚"
 # Upload Settings
 UPLOAD_DIRECTORY = "./uploads"
 MAX_FILE_SIZE_MB = 10
+UPLOAD_WRITE_CHUNK_BYTES = 1 << 20  # Uploads are written to disk 1 MiB at a time
@@ -0,0 +1,131 @@
+"""
+Document storage for the FAISS index backed by a memory-mapped Parquet file
+"""
+import json
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Union
+import pyarrow as pa
+import pyarrow.parquet as pq
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("page_content", pa.string()),
+    ("metadata", pa.string())
+])
+
+# Small row groups keep each lookup to a few KB of reads
+_ROW_GROUP_SIZE = 1024
+_CACHED_ROW_GROUPS = 8
+
+
+class ParquetDocstore(Docstore, AddableMixin):
+    """
+    Docstore whose ids are FAISS row numbers (as strings)
+    Opening reads only the Parquet footer; a lookup decodes the one row group holding the row.
+    New documents are kept in memory until save()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: Dict[str, Document] = {}
+        self._groups = OrderedDict()
+        self._open()
+
+    def _open(self):
+        """Map the Parquet file and index where each row group starts"""
+        self._file = None
+        self._group_starts = []
+        self._num_rows = 0
+        self._groups.clear()
+
+        if not os.path.exists(self.path):
+            return
+
+        self._file = pq.ParquetFile(self.path, memory_map=True)
+        metadata = self._file.metadata
+        for i in range(metadata.num_row_groups):
+            self._group_starts.append(self._num_rows)
+            self._num_rows += metadata.row_group(i).num_rows
+
+    def __len__(self) -> int:
+        return self._num_rows + len(self._pending)
+
+    def _read_group(self, group: int) -> pa.Table:
+        """Read a row group, keeping a few recently used ones decoded"""
+        table = self._groups.get(group)
+        if table is None:
+            table = self._file.read_row_group(group, columns=["page_content", "metadata"])
+            self._groups[group] = table
+            while len(self._groups) > _CACHED_ROW_GROUPS:
+                self._groups.popitem(last=False)
+        else:
+            self._groups.move_to_end(group)
+        return table
+
+    def search(self, search: str) -> Union[str, Document]:
+        """Look up a document by id"""
+        if search in self._pending:
+            return self._pending[search]
+
+        try:
+            row = int(search)
+        except ValueError:
+            return f"ID {search} not found."
+        if self._file is None or not 0 <= row < self._num_rows:
+            return f"ID {search} not found."
+
+        group = bisect_right(self._group_starts, row) - 1
+        table = self._read_group(group)
+        offset = row - self._group_starts[group]
+        return Document(
+            page_content=table.column("page_content")[offset].as_py(),
+            metadata=json.loads(table.column("metadata")[offset].as_py())
+        )
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Queue documents to be written on the next save()"""
+        self._pending.update(texts)
+
+    def save(self):
+        """Write queued documents to the Parquet file"""
+        if not self._pending:
+            return
+
+        ids = sorted(self._pending, key=int)
+        # Lookups are by row position, so new ids must continue the saved rows exactly
+        expected = list(range(self._num_rows, self._num_rows + len(ids)))
+        if [int(i) for i in ids] != expected:
+            raise ValueError(
+                f"Docstore ids {ids[0]}..{ids[-1]} don't follow the {self._num_rows} saved rows"
+            )
+
+        new_rows = pa.Table.from_pydict({
+            "id": [int(i) for i in ids],
+            "page_content": [self._pending[i].page_content for i in ids],
+            "metadata": [json.dumps(self._pending[i].metadata) for i in ids]
+        }, schema=_SCHEMA)
+
+        # Parquet can't be appended to, so rewrite existing rows plus the new ones.
+        # Existing rows come from this store's own mapping: the file at self.path may since
+        # have been replaced by another session
+        tables = [new_rows]
+        if self._file is not None:
+            tables.insert(0, self._file.read())
+        # Release the mapping before replacing the file
+        self._close()
+
+        tmp_path = self.path + ".tmp"
+        pq.write_table(pa.concat_tables(tables), tmp_path, row_group_size=_ROW_GROUP_SIZE)
+        os.replace(tmp_path, self.path)
+
+        self._pending.clear()
+        self._open()
+
+    def _close(self):
+        """Drop references to the mapped file and its decoded row groups"""
+        self._groups.clear()
+        self._file = None
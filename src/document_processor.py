@@ -1,40 +1,100 @@
 """
 Document processing utilities for PDF extraction and text chunking
 """
+import functools
+import mmap
+import multiprocessing
 import os
-from typing import List
+import re
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import List, Tuple
 import PyPDF2
 import pdfplumber
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from src.config import CHUNK_SIZE, CHUNK_OVERLAP
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP, PARALLEL_EXTRACTION_MIN_PAGES
+
+# Chunk break candidates: paragraph, line, then word boundaries
+_SEP_RE = re.compile(r"\n\n|\n| ")
+
+
+@contextmanager
+def _open_pdf(pdf_path: str):
+    """
+    Open a PDF with pdfplumber over a read-only memory map of the file
+    Reads come straight from the OS page cache instead of through a buffered file object
+    """
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with pdfplumber.open(mm) as pdf:
+            yield pdf
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> Tuple[int, List[str]]:
+    """
+    Extract text from pages [start, stop) in a worker process
+    pdfplumber objects can't be pickled, so each worker opens its own handle
+    """
+    with _open_pdf(pdf_path) as pdf:
+        return start, [pdf.pages[i].extract_text() for i in range(start, stop)]
+
+
+@functools.lru_cache(maxsize=1)
+def _extraction_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes for page extraction, started once per process and reused for every PDF
+    Spawned workers re-run the main module: under Streamlit that is app.py, so each one
+    imports the whole app (about 2 s and 200 MB per worker) before extracting anything
+    """
+    # Spawn fresh workers: the app process runs torch/tokenizers thread pools,
+    # whose held locks a forked child would inherit
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn")
+    )
 
 
 class DocumentProcessor:
     """Handles PDF processing and text chunking"""
     
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        self.chunk_size = CHUNK_SIZE
+        self.chunk_overlap = CHUNK_OVERLAP
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
         Extract text from PDF file using pdfplumber (better for complex PDFs)
+        Pages are extracted in parallel across CPU cores for larger PDFs
         Falls back to PyPDF2 if pdfplumber fails
         """
         text = ""
         
         try:
             # Try pdfplumber first (better for tables and complex layouts)
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n\n"
+            with _open_pdf(pdf_path) as pdf:
+                num_pages = len(pdf.pages)
+                if num_pages < PARALLEL_EXTRACTION_MIN_PAGES:
+                    page_texts = [page.extract_text() for page in pdf.pages]
+            
+            if num_pages >= PARALLEL_EXTRACTION_MIN_PAGES:
+                workers = os.cpu_count() or 1
+                # A few page ranges per worker keeps cores busy without reopening the PDF per page
+                step = max(1, -(-num_pages // (workers * 4)))
+                executor = _extraction_pool()
+                try:
+                    futures = [
+                        executor.submit(_extract_page_range, pdf_path, start, min(start + step, num_pages))
+                        for start in range(0, num_pages, step)
+                    ]
+                    results = sorted(future.result() for future in futures)
+                except BrokenProcessPool:
+                    # A dead worker breaks the pool for good; start a new one for the next PDF
+                    _extraction_pool.cache_clear()
+                    raise
+                page_texts = [page_text for _, texts in results for page_text in texts]
+            
+            text = "".join(page_text + "\n\n" for page_text in page_texts if page_text)
         except Exception as e:
             print(f"pdfplumber failed, trying PyPDF2: {e}")
             
@@ -51,19 +111,52 @@ class DocumentProcessor:
         
         return text.strip()
     
+    def _fast_chunk(self, text: str) -> List[str]:
+        """
+        Split text into overlapping chunks of at most chunk_size characters
+        Break offsets come from a single regex scan; windows are packed greedily
+        and only cut mid-word when a window contains no separator
+        """
+        starts, ends = [], []
+        for match in _SEP_RE.finditer(text):
+            starts.append(match.start())
+            ends.append(match.end())
+        
+        pieces = []
+        n = len(text)
+        lo = 0
+        while lo < n:
+            if n - lo <= self.chunk_size:
+                end = n
+            else:
+                # Last separator that still fits in the window
+                i = bisect_right(starts, lo + self.chunk_size) - 1
+                end = starts[i] if i >= 0 and starts[i] > lo else lo + self.chunk_size
+            
+            piece = text[lo:end].strip()
+            if piece:
+                pieces.append(piece)
+            if end >= n:
+                break
+            
+            # Start the next chunk at the first separator inside the overlap window
+            j = bisect_left(starts, max(end - self.chunk_overlap, lo + 1))
+            lo = ends[j] if j < len(starts) and starts[j] < end else end
+        
+        return pieces
+    
     def chunk_text(self, text: str, metadata: dict = None) -> List[Document]:
         """
-        Split text into chunks using RecursiveCharacterTextSplitter
+        Split text into overlapping chunks
         Returns list of LangChain Document objects
         """
         if metadata is None:
             metadata = {}
         
-        # Create documents with metadata
-        documents = [Document(page_content=text, metadata=metadata)]
-        
-        # Split into chunks
-        chunks = self.text_splitter.split_documents(documents)
+        chunks = [
+            Document(page_content=piece, metadata=dict(metadata))
+            for piece in self._fast_chunk(text)
+        ]
         
         return chunks
     
@@ -95,6 +188,6 @@ class DocumentProcessor:
         if len(text) <= max_length:
             return text
         
-        # Simple extractive summary: return first max_length characters
-        summary = text[:max_length].rsplit('.', 1)[0] + '.'
-        return summary
+        # Simple extractive summary: cut at the last sentence end within max_length
+        cut = text.rfind('.', 0, max_length)
+        return text[:cut + 1] if cut > 0 else text[:max_length]
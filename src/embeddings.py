@@ -0,0 +1,112 @@
+"""
+Int8-quantized sentence embeddings served by ONNX Runtime
+"""
+import os
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.config import (
+    EMBEDDING_MODEL,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_SEQ_LENGTH,
+    ONNX_MODEL_DIRECTORY
+)
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+
+def export_quantized_model(model_name: str, output_dir: str) -> str:
+    """
+    Export a sentence-transformer to ONNX and quantize its weights to int8
+    Same result as `optimum-cli export onnx --task feature-extraction` followed by quantize_dynamic
+    Returns the path of the quantized model
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+
+    quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(
+        os.path.join(output_dir, "model.onnx"),
+        quantized_path,
+        weight_type=QuantType.QInt8
+    )
+    return quantized_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Mean-pooled, L2-normalized sentence embeddings from an int8 ONNX model"""
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        model_dir: str = ONNX_MODEL_DIRECTORY,
+        batch_size: int = EMBED_BATCH_SIZE
+    ):
+        if not ONNX_AVAILABLE:
+            raise ImportError(
+                "ONNX Runtime not found. Install with: pip install optimum[onnxruntime]"
+            )
+
+        # Export and quantize once; later runs load the saved model
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+        if not os.path.exists(model_path):
+            model_path = export_quantized_model(model_name, model_dir)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Embed one batch of texts in a single forward pass"""
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=EMBED_MAX_SEQ_LENGTH,
+            return_tensors="np"
+        )
+        inputs = {
+            name: value.astype(np.int64)
+            for name, value in encoded.items()
+            if name in self._input_names
+        }
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2 normalization (as sentence-transformers does)
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents"""
+        if not texts:
+            return []
+
+        batches = [
+            self._encode(texts[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.concatenate(batches).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        return self._encode([text])[0].tolist()
@@ -1,21 +1,105 @@
 """
 LLM integration for chat, summarization, and explanations using Groq API
 """
-from typing import List
+import asyncio
+import atexit
+import functools
+import hashlib
+import re
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Iterator, List, Sequence
+import tiktoken
 from langchain_core.documents import Document
 import os
 try:
-    from groq import Groq
+    import httpx
+    from groq import AsyncGroq, Groq
     GROQ_AVAILABLE = True
 except ImportError:
     GROQ_AVAILABLE = False
+from src.semantic_cache import SemanticCache
+
+# Questions that need more context documents
+_WIDE_QUERY_RE = re.compile(r"\b(all|list|laws|chapter)\b", re.I)
+
+# Token budgets for document text in each kind of prompt
+_CHAT_CONTEXT_TOKENS = 1000
+_SUMMARY_CONTEXT_TOKENS = 1000
+_EXPLAIN_CONTEXT_TOKENS = 200
+
+# Close approximation of the Llama 3 tokenizer. tiktoken downloads its BPE file on first
+# use, so hosts that can't reach it fall back to estimating tokens from characters
+_TOKENIZER_ENCODING = "cl100k_base"
+_CHARS_PER_TOKEN = 4
+
+# Below this much retrieved text there is nothing worth sending to the LLM
+_MIN_CONTEXT_CHARS = 50
+_NO_CONTEXT_RESPONSE = "I couldn't find relevant passages in the document for that question."
+
+# System prompts are fixed strings so every request shares the same leading tokens,
+# which providers with prefix caching can reuse; per-request text goes in the user message
+_CHAT_SYSTEM_PROMPT = """You are an AI tutor helping students understand their course materials.
+Answer ONLY based on the provided context from the student's document.
+Be specific and accurate. If asked to list multiple items (like "all laws" or "4 laws"), make sure to find and list ALL of them from the context.
+If the context doesn't contain complete information, acknowledge what's missing."""
+_SUMMARY_SYSTEM_PROMPT = "You are an AI tutor. Provide a clear, comprehensive summary of the key topics and main points."
+_EXPLAIN_SYSTEM_PROMPT = "You are an AI tutor. Explain concepts in simple, clear language."
+
+# User prompt templates, filled with format_map at request time
+_CHAT_TEMPLATE = """Context from the document:
+{context}
+
+Student question: {question}
+
+Answer based on the context above:"""
+_SUMMARY_TEMPLATE = """Summarize the key topics and main ideas from this text:
+
+{text}
+
+Provide a structured summary with the main points:"""
+_EXPLAIN_CONTEXT_TEMPLATE = "Explain '{term}' using this context:\n{context}"
+_EXPLAIN_TEMPLATE = "Explain what '{term}' means in simple terms."
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding() -> "tiktoken.Encoding":
+    """Token encoding for context budgets, loaded on first use; None if it can't be fetched"""
+    try:
+        return tiktoken.get_encoding(_TOKENIZER_ENCODING)
+    except Exception as e:
+        print(f"Token encoding unavailable, estimating from characters: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=4)
+def _groq_client(api_key: str) -> "Groq":
+    """
+    Shared Groq client per API key
+    Keeps HTTP/2 connections alive so each request skips the TCP and TLS handshake
+    """
+    return Groq(
+        api_key=api_key,
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+    )
 
 
 class LLMHandler:
-    """Handles LLM interactions using Groq API (fast and free)"""
+    """
+    Handles LLM interactions using Groq API (fast and free)
+    Chat, summary and explanation each have an async twin (a-prefixed)
+    so independent calls can be overlapped with asyncio.gather
+    """
     
-    def __init__(self, api_key: str = None):
-        """Initialize Groq API client"""
+    def __init__(self, api_key: str = None, embed_query: Callable[[str], Sequence[float]] = None):
+        """
+        Initialize Groq API client
+        Pass the query embedder the vector store uses (cached_query_embedder) to enable the semantic response cache
+        """
         if not GROQ_AVAILABLE:
             raise ImportError(
                 "Groq package not found. Install with: pip install groq"
@@ -27,8 +111,58 @@ class LLMHandler:
                 "Groq API key required. Get free key at: https://console.groq.com"
             )
         
-        self.client = Groq(api_key=self.api_key)
+        self.client = _groq_client(self.api_key)
+        # Async clients let callers overlap several LLM calls with asyncio.gather;
+        # one per event loop because pooled connections can't move between loops
+        self._aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGroq]" = weakref.WeakKeyDictionary()
+        self._aclients_lock = threading.Lock()
+        self._aclient_closers = set()
         self.model = "llama-3.1-8b-instant"  # Fast and accurate
+        
+        # Reuse answers for near-duplicate questions over the same context
+        self._cache = None
+        if embed_query is not None:
+            self._cache = SemanticCache(embed_query)
+            atexit.register(self._cache.save)
+        
+        # Identical requests already waiting on the API, shared by concurrent callers
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+    
+    @property
+    def aclient(self) -> "AsyncGroq":
+        """
+        Async Groq client for the running event loop
+        Its HTTP/2 connections stay open across calls made on the same loop
+        and are closed when the loop shuts down
+        """
+        loop = asyncio.get_running_loop()
+        # The handler is shared across sessions, each of which may run its own loop
+        with self._aclients_lock:
+            client = self._aclients.get(loop)
+            if client is None:
+                http_client = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=20)
+                )
+                client = AsyncGroq(api_key=self.api_key, http_client=http_client)
+                self._aclients[loop] = client
+                closer = loop.create_task(self._close_aclient(loop, http_client))
+                self._aclient_closers.add(closer)
+                closer.add_done_callback(self._aclient_closers.discard)
+        return client
+    
+    async def _close_aclient(self, loop: asyncio.AbstractEventLoop, http_client: "httpx.AsyncClient"):
+        """
+        Wait for the loop to shut down, then close its client's connections
+        asyncio.run cancels tasks still pending when the main coroutine returns, which ends the wait
+        """
+        try:
+            await loop.create_future()
+        finally:
+            with self._aclients_lock:
+                self._aclients.pop(loop, None)
+            await http_client.aclose()
     
     def _generate(self, system_prompt: str, user_prompt: str, max_tokens: int = 512) -> str:
         """Helper method to generate text using Groq"""
@@ -46,6 +180,43 @@ class LLMHandler:
         except Exception as e:
             return f"Error: {str(e)}"
     
+    def _generate_stream(self, system_prompt: str, user_prompt: str, max_tokens: int = 512) -> Iterator[str]:
+        """
+        Helper method to stream generated text from Groq as it arrives
+        Errors are raised rather than yielded: part of the answer may already be out,
+        and callers must not mistake a truncated answer for a complete one
+        """
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True
+        )
+        for chunk in stream:
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+    
+    async def _agenerate(self, system_prompt: str, user_prompt: str, max_tokens: int = 512) -> str:
+        """Async version of _generate"""
+        try:
+            response = await self.aclient.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.7
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
     # def answer_question(self, question: str, context_docs: List[Document]) -> str:
     #     """
     #     Answer a question using retrieved context
@@ -64,31 +235,77 @@ class LLMHandler:
         
     #     return self._generate(system, user, max_tokens=400)
     
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        """Number of tokens in text"""
+        encoding = _encoding()
+        if encoding is None:
+            return -(-len(text) // _CHARS_PER_TOKEN)
+        return len(encoding.encode(text, disallowed_special=()))
+    
+    @staticmethod
+    def _truncate_tokens(text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens"""
+        encoding = _encoding()
+        if encoding is None:
+            return text[:max_tokens * _CHARS_PER_TOKEN]
+        ids = encoding.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return text
+        return encoding.decode(ids[:max_tokens])
+    
+    def _summary_prompts(self, text: str):
+        """Build the system and user prompts for a summary"""
+        user = _SUMMARY_TEMPLATE.format_map({
+            "text": self._truncate_tokens(text, _SUMMARY_CONTEXT_TOKENS)
+        })
+        return _SUMMARY_SYSTEM_PROMPT, user
+    
     def summarize_text(self, text: str, max_length: int = 200) -> str:
         """
         Summarize given text using LLM
         """
-        system = "You are an AI tutor. Provide a clear, comprehensive summary of the key topics and main points."
-        user = f"""Summarize the key topics and main ideas from this text:
-
-        {text[:4000]}
-
-        Provide a structured summary with the main points:"""
-        
+        system, user = self._summary_prompts(text)
         return self._generate(system, user, max_tokens=400)
     
+    def summarize_text_stream(self, text: str) -> Iterator[str]:
+        """Streaming version of summarize_text; API errors are raised"""
+        system, user = self._summary_prompts(text)
+        return self._generate_stream(system, user, max_tokens=400)
+    
+    async def asummarize_text(self, text: str, max_length: int = 200) -> str:
+        """Async version of summarize_text"""
+        system, user = self._summary_prompts(text)
+        return await self._agenerate(system, user, max_tokens=400)
+    
+    def _explain_prompts(self, term: str, context: str = ""):
+        """Build the system and user prompts for a term explanation"""
+        if context:
+            user = _EXPLAIN_CONTEXT_TEMPLATE.format_map({
+                "term": term,
+                "context": self._truncate_tokens(context, _EXPLAIN_CONTEXT_TOKENS)
+            })
+        else:
+            user = _EXPLAIN_TEMPLATE.format_map({"term": term})
+        return _EXPLAIN_SYSTEM_PROMPT, user
+    
     def explain_term(self, term: str, context: str = "") -> str:
         """
         Provide a simplified explanation of a difficult term or concept
         """
-        system = "You are an AI tutor. Explain concepts in simple, clear language."
-        if context:
-            user = f"Explain '{term}' using this context:\n{context[:800]}"
-        else:
-            user = f"Explain what '{term}' means in simple terms."
-        
+        system, user = self._explain_prompts(term, context)
         return self._generate(system, user, max_tokens=200)
     
+    def explain_term_stream(self, term: str, context: str = "") -> Iterator[str]:
+        """Streaming version of explain_term; API errors are raised"""
+        system, user = self._explain_prompts(term, context)
+        return self._generate_stream(system, user, max_tokens=200)
+    
+    async def aexplain_term(self, term: str, context: str = "") -> str:
+        """Async version of explain_term"""
+        system, user = self._explain_prompts(term, context)
+        return await self._agenerate(system, user, max_tokens=200)
+    
     # def generate_response(self, prompt: str) -> str:
     #     """
     #     Generate a general response for any prompt
@@ -96,23 +313,185 @@ class LLMHandler:
     #     system = "You are a helpful AI tutor assistant."
     #     return self._generate(system, prompt, max_tokens=300)
     
+    @staticmethod
+    def _context_key(docs: List[Document]) -> str:
+        """Fingerprint the retrieved documents so cached answers only match the same context"""
+        digest = hashlib.blake2b(digest_size=16)
+        for doc in docs:
+            digest.update(str(doc.metadata.get("source", "")).encode())
+            digest.update(doc.page_content.encode())
+        return digest.hexdigest()
+    
+    def _claim(self, key: str):
+        """Return (future, owner) for a request key, registering a new future if none is in flight"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+    
+    def _release(self, key: str):
+        """Forget a finished in-flight request"""
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+    
+    def _deduplicate(self, key: str, fn: Callable[[], str]) -> str:
+        """
+        Run fn once for concurrent callers sharing the same key
+        Later callers wait for the first caller's result instead of calling the API again
+        """
+        future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._release(key)
+        
+        return future.result()
+    
+    async def _adeduplicate(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        """Async version of _deduplicate, sharing in-flight requests with sync callers"""
+        future, owner = self._claim(key)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        
+        try:
+            future.set_result(await fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._release(key)
+        
+        return future.result()
+    
+    @staticmethod
+    def _has_context(context_docs: List[Document]) -> bool:
+        """Whether retrieval returned enough text to answer from"""
+        return sum(len(doc.page_content) for doc in context_docs) >= _MIN_CONTEXT_CHARS
+    
+    def _chat_request(self, user_message: str, context_docs: List[Document]):
+        """Select context docs and compute the context fingerprint and request key"""
+        # Build context from documents - use more for comprehensive queries
+        num_docs = 8 if _WIDE_QUERY_RE.search(user_message) else 5
+        docs = context_docs[:num_docs]
+        context_key = self._context_key(docs)
+        request_key = hashlib.blake2b((user_message + context_key).encode(), digest_size=16).hexdigest()
+        return docs, context_key, request_key
+    
+    def _chat_prompts(self, user_message: str, docs: List[Document]):
+        """Build the system and user prompts for a chat answer"""
+        # Pack whole documents until the token budget runs out, truncating the last one
+        parts = []
+        remaining = _CHAT_CONTEXT_TOKENS
+        for doc in docs:
+            n_tokens = self._count_tokens(doc.page_content)
+            if n_tokens >= remaining:
+                parts.append(self._truncate_tokens(doc.page_content, remaining))
+                break
+            parts.append(doc.page_content)
+            remaining -= n_tokens
+        context = "\n\n".join(parts)
+        
+        # Retrieved context changes every turn, so it trails the static system prompt
+        user = _CHAT_TEMPLATE.format_map({"context": context, "question": user_message})
+        return _CHAT_SYSTEM_PROMPT, user
+    
+    def _cache_lookup(self, user_message: str, context_key: str):
+        """Return (query_vec, cached_response); both are None when the cache is off"""
+        if self._cache is None:
+            return None, None
+        query_vec = self._cache.embed(user_message)
+        return query_vec, self._cache.lookup(query_vec, context_key)
+    
+    def _cache_store(self, query_vec, user_message: str, context_key: str, response: str):
+        """Remember a response; failures aren't cached so the next attempt retries the API"""
+        if self._cache is not None and not response.startswith("Error:"):
+            self._cache.add(query_vec, user_message, context_key, response)
+    
     def chat_with_context(self, user_message: str, context_docs: List[Document]) -> str:
         """
         Generate a chat response with document context
+        Near-duplicate questions over the same documents are answered from the semantic cache,
+        and identical concurrent requests share a single API call
         """
-        # Build context from documents - use more for comprehensive queries
-        num_docs = 8 if any(word in user_message.lower() for word in ['all', 'list', 'laws', 'chapter']) else 5
-        context = "\n\n".join([doc.page_content for doc in context_docs[:num_docs]])
+        if not self._has_context(context_docs):
+            return _NO_CONTEXT_RESPONSE
         
-        system = """You are an AI tutor helping students understand their course materials. 
-        Answer ONLY based on the provided context from the student's document. 
-        Be specific and accurate. If asked to list multiple items (like "all laws" or "4 laws"), make sure to find and list ALL of them from the context.
-        If the context doesn't contain complete information, acknowledge what's missing."""
-        user = f"""Context from the document:
-        {context[:4000]}
-
-        Student question: {user_message}
-
-        Answer based on the context above:"""
+        docs, context_key, request_key = self._chat_request(user_message, context_docs)
+        return self._deduplicate(request_key, lambda: self._chat(user_message, docs, context_key))
+    
+    def _chat(self, user_message: str, docs: List[Document], context_key: str) -> str:
+        """Answer from the semantic cache or the API"""
+        query_vec, cached = self._cache_lookup(user_message, context_key)
+        if cached is not None:
+            return cached
+        
+        system, user = self._chat_prompts(user_message, docs)
+        response = self._generate(system, user, max_tokens=500)
+        self._cache_store(query_vec, user_message, context_key, response)
+        return response
+    
+    def chat_with_context_stream(self, user_message: str, context_docs: List[Document]) -> Iterator[str]:
+        """
+        Streaming version of chat_with_context, yielding the answer as it is generated
+        Cache hits and duplicate concurrent requests yield the full answer at once.
+        API errors are raised, and nothing is cached for a failed answer
+        """
+        if not self._has_context(context_docs):
+            yield _NO_CONTEXT_RESPONSE
+            return
+        
+        docs, context_key, request_key = self._chat_request(user_message, context_docs)
+        future, owner = self._claim(request_key)
+        if not owner:
+            yield future.result()
+            return
+        
+        try:
+            query_vec, cached = self._cache_lookup(user_message, context_key)
+            if cached is not None:
+                response = cached
+                yield cached
+            else:
+                system, user = self._chat_prompts(user_message, docs)
+                parts = []
+                for token in self._generate_stream(system, user, max_tokens=500):
+                    parts.append(token)
+                    yield token
+                response = "".join(parts).strip()
+                self._cache_store(query_vec, user_message, context_key, response)
+            
+            future.set_result(response)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # The consumer may stop reading early; don't leave waiters hanging
+            if not future.done():
+                future.set_exception(RuntimeError("Streaming response was interrupted"))
+            self._release(request_key)
+    
+    async def achat_with_context(self, user_message: str, context_docs: List[Document]) -> str:
+        """Async version of chat_with_context"""
+        if not self._has_context(context_docs):
+            return _NO_CONTEXT_RESPONSE
+        
+        docs, context_key, request_key = self._chat_request(user_message, context_docs)
+        return await self._adeduplicate(request_key, lambda: self._achat(user_message, docs, context_key))
+    
+    async def _achat(self, user_message: str, docs: List[Document], context_key: str) -> str:
+        """Async version of _chat"""
+        query_vec, cached = self._cache_lookup(user_message, context_key)
+        if cached is not None:
+            return cached
         
-        return self._generate(system, user, max_tokens=500)
+        system, user = self._chat_prompts(user_message, docs)
+        response = await self._agenerate(system, user, max_tokens=500)
+        self._cache_store(query_vec, user_message, context_key, response)
+        return response
@@ -0,0 +1,119 @@
+"""
+Semantic response cache keyed by query embeddings
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence
+import numpy as np
+from src.config import (
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_PATH
+)
+
+
+class SemanticCache:
+    """Returns stored answers for questions that are close in meaning to earlier ones"""
+
+    def __init__(
+        self,
+        embed_query: Callable[[str], Sequence[float]],
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        path: str = SEMANTIC_CACHE_PATH
+    ):
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+
+        # key -> (embedding, prompt, context_key, response, created_at)
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a query as a float32 vector"""
+        return np.asarray(self.embed_query(text), dtype=np.float32)
+
+    def lookup(self, query_vec: np.ndarray, context_key: str) -> Optional[str]:
+        """
+        Find a cached response for a similar query over the same context
+        Returns None on a miss
+        """
+        with self._lock:
+            self._evict_expired()
+
+            keys = [k for k, entry in self._entries.items() if entry[2] == context_key]
+            if not keys:
+                return None
+
+            cached = np.stack([self._entries[k][0] for k in keys])
+            norms = np.linalg.norm(cached, axis=1) * np.linalg.norm(query_vec)
+            sims = cached @ query_vec / np.maximum(norms, 1e-12)
+
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+
+            # Refresh LRU position on hit
+            self._entries.move_to_end(keys[best])
+            return self._entries[keys[best]][3]
+
+    def add(self, query_vec: np.ndarray, prompt: str, context_key: str, response: str):
+        """Store a response, evicting the least recently used entries when full"""
+        with self._lock:
+            self._entries[self._next_key] = (query_vec, prompt, context_key, response, time.time())
+            self._next_key += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self):
+        """Remove entries older than the TTL (caller holds the lock)"""
+        cutoff = time.time() - self.ttl_seconds
+        expired = [k for k, entry in self._entries.items() if entry[4] < cutoff]
+        for k in expired:
+            del self._entries[k]
+
+    def load(self):
+        """Load persisted entries from disk, skipping any that have expired"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "rb") as f:
+                entries = pickle.load(f)
+
+            with self._lock:
+                for entry in entries[-self.max_entries:]:
+                    self._entries[self._next_key] = entry
+                    self._next_key += 1
+                self._evict_expired()
+        except Exception as e:
+            print(f"Could not load semantic cache: {e}")
+
+    def save(self):
+        """Persist entries to disk"""
+        try:
+            with self._lock:
+                self._evict_expired()
+                entries = list(self._entries.values())
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "wb") as f:
+                pickle.dump(entries, f)
+        except Exception as e:
+            print(f"Could not save semantic cache: {e}")
@@ -1,117 +1,864 @@
 """
 Vector store management using FAISS for document embeddings and retrieval
 """
+import asyncio
+import functools
+import hashlib
 import os
 import pickle
-from typing import List
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+import faiss
+import numpy as np
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_huggingface import HuggingFaceEmbeddings
+from src.docstore import ParquetDocstore
+from src.rerank import rerank
+from src.embeddings import ONNX_AVAILABLE, OnnxEmbeddings
 from src.config import (
     FAISS_PERSIST_DIRECTORY,
-    EMBEDDING_MODEL
+    EMBEDDING_MODEL,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_SEQ_LENGTH,
+    EMBED_TOKEN_BUDGET,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    IVF_PQ_MIN_VECTORS,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    SQ8_MIN_TRAIN_VECTORS,
+    IVF_TRAIN_SAMPLE,
+    RERANK_LENGTH_PENALTY,
+    EF_SEARCH_CANDIDATES,
+    EF_BENCHMARK_QUERIES
 )
 
 
+def create_embeddings() -> Embeddings:
+    """
+    Load the embeddings model (runs locally, no API key needed)
+    CPU hosts use the int8 ONNX Runtime encoder when available, GPUs use PyTorch
+    """
+    import torch
+    
+    if torch.cuda.is_available():
+        device = 'cuda'
+    else:
+        device = 'cpu'
+        if ONNX_AVAILABLE:
+            try:
+                return OnnxEmbeddings(EMBEDDING_MODEL)
+            except Exception as e:
+                print(f"ONNX embeddings unavailable, using PyTorch: {e}")
+        torch.set_num_threads(os.cpu_count() or 1)
+    
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={'device': device, 'trust_remote_code': True},
+        encode_kwargs={
+            'normalize_embeddings': True,
+            'batch_size': EMBED_BATCH_SIZE,
+            'convert_to_numpy': True
+        }
+    )
+
+
+def cached_query_embedder(embeddings: Embeddings) -> Callable[[str], Tuple[float, ...]]:
+    """
+    Wrap embed_query in an LRU cache, returning vectors as hashable tuples
+    Share one wrapper between the vector store and the semantic cache so a chat turn
+    runs the encoder once for its prompt
+    """
+    @functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+    def embed_query(query: str) -> Tuple[float, ...]:
+        return tuple(np.asarray(embeddings.embed_query(query), dtype=np.float32).tolist())
+    
+    return embed_query
+
+
+def auto_tune(vector_count: int) -> Tuple[int, int, int]:
+    """
+    Pick HNSW (M, efConstruction, efSearch) for a corpus size
+    Larger graphs need more links and wider searches to keep recall up
+    """
+    if vector_count < 1_000:
+        return 16, 100, 32
+    if vector_count < 10_000:
+        return 32, 200, 64
+    if vector_count < 100_000:
+        return 32, 200, 128
+    return 48, 400, 256
+
+
+def index_factory_string(vector_count: int, use_int8: bool = True) -> str:
+    """
+    FAISS index_factory description for a new store of vector_count vectors
+    Smaller corpora use an HNSW graph for sub-linear search; large ones use IVF-PQ to cut memory
+    """
+    if vector_count >= IVF_PQ_MIN_VECTORS:
+        return f"IVF{IVF_NLIST},PQ{PQ_M}"
+    
+    m, _, _ = auto_tune(vector_count)
+    # SQ8 stores one byte per dimension: 4x smaller and less memory traffic per distance.
+    # Its per-dimension ranges are fixed at training time, so wait for enough vectors
+    if use_int8 and vector_count >= SQ8_MIN_TRAIN_VECTORS:
+        return f"HNSW{m},SQ8"
+    return f"HNSW{m},Flat"
+
+
+# Every session's manager writes the same persist directory; writes are made one at a time
+_WRITE_LOCK = threading.RLock()
+
+
 class VectorStoreManager:
     """Manages vector embeddings and similarity search using FAISS"""
     
-    def __init__(self):
-        # Initialize embeddings model (runs locally, no API key needed)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu', 'trust_remote_code': True},
-            encode_kwargs={'normalize_embeddings': True, 'batch_size': 32}
-        )
+    def __init__(
+        self,
+        embeddings: Embeddings = None,
+        use_int8: bool = True,
+        embed_query: Callable[[str], Tuple[float, ...]] = None
+    ):
+        # Share an already-loaded embeddings model when one is passed in
+        self.embeddings = embeddings if embeddings is not None else create_embeddings()
+        
+        # Store new HNSW indexes with int8 scalar-quantized vectors
+        self.use_int8 = use_int8
         
         # Ensure persist directory exists
         os.makedirs(FAISS_PERSIST_DIRECTORY, exist_ok=True)
         
+        # Repeated queries reuse their vector instead of re-running the encoder;
+        # pass a cached_query_embedder to share the cache with other components
+        self._embed_query = embed_query or cached_query_embedder(self.embeddings)
+        
+        # Searches run here when called from async code, keeping the event loop free
+        self._pool = ThreadPoolExecutor(max_workers=4)
+        
+        # Tokenizer for length-aware ingest batching, loaded on first use. It is never the
+        # encoder's own: that one is shared by every session and pads, and switching a fast
+        # tokenizer's padding while another thread encodes fails with "Already borrowed"
+        self._tokenizer = None
+        
+        # Median search latency (ms) per efSearch, measured in the background
+        # once a search is given a time budget
+        self._ef_curve: Dict[int, float] = {}
+        self._ef_curve_size = None
+        self._ef_future = None
+        self._ef_index = None
+        
+        # Content hashes of every chunk already in the store
+        self._open_seen_db()
+        
         # Initialize or load existing FAISS
         self.vectorstore = None
+        self.index_spec = None
+        self._index_mmapped = False
+        # Identity of the index file this store was loaded from or last saved
+        self._loaded_version = None
         self._load_or_create_vectorstore()
     
+    def _open_seen_db(self):
+        """Open the SQLite table of embedded chunk hashes"""
+        # Ingest runs on a worker thread, so the connection is shared across threads
+        self._seen = sqlite3.connect(
+            os.path.join(FAISS_PERSIST_DIRECTORY, "seen.db"),
+            check_same_thread=False
+        )
+        self._seen.execute("CREATE TABLE IF NOT EXISTS seen (hash TEXT PRIMARY KEY, id INTEGER)")
+        self._seen.commit()
+    
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        """Identify a chunk by its text"""
+        return hashlib.sha256(text.encode()).hexdigest()
+    
+    def _stored_rows(self, hashes: List[str]) -> Dict[str, int]:
+        """
+        FAISS rows of the chunks with these hashes that are already in this store
+        The table is shared between sessions, so a hit only counts if this store's
+        document at the recorded id really has that content
+        """
+        stored = {}
+        if self.vectorstore is None:
+            return stored
+        
+        n_vectors = self.vectorstore.index.ntotal
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = self._seen.execute(
+                f"SELECT hash, id FROM seen WHERE hash IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            for h, row in rows:
+                if row >= n_vectors:
+                    continue
+                doc = self.vectorstore.docstore.search(str(row))
+                if isinstance(doc, Document) and self._content_hash(doc.page_content) == h:
+                    stored[h] = row
+        return stored
+    
+    def _unseen(self, texts: List[str]) -> List[int]:
+        """Indices of texts not yet in this store, keeping the first of any repeats"""
+        hashes = [self._content_hash(text) for text in texts]
+        
+        seen = set(self._stored_rows(hashes))
+        keep = []
+        for i, h in enumerate(hashes):
+            if h not in seen:
+                seen.add(h)
+                keep.append(i)
+        return keep
+    
     def _load_or_create_vectorstore(self):
         """Load existing vector store or create new one"""
         try:
             # Try to load existing vectorstore
             index_path = os.path.join(FAISS_PERSIST_DIRECTORY, "index.faiss")
+            # Taken before reading, so a save landing in between only causes an extra reload
+            self._loaded_version = self._index_version()
             if os.path.exists(index_path):
-                self.vectorstore = FAISS.load_local(
-                    FAISS_PERSIST_DIRECTORY,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
+                # Memory-map the index so vectors are paged in on demand instead of read up front
+                try:
+                    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                except RuntimeError:
+                    index = faiss.read_index(index_path)
+                # Only IVF inverted lists are mapped; other index types ignore the flag
+                self._index_mmapped = self._mapped_invlists(index) is not None
+                
+                if not os.path.exists(self._docs_path):
+                    self._migrate_pickle_docstore(index.ntotal)
+                
+                # Stores created before factory strings were recorded leave this as None
+                if os.path.exists(self._spec_path):
+                    with open(self._spec_path) as f:
+                        self.index_spec = f.read().strip()
+                
+                # Docstore ids are FAISS row numbers, so the id map needs no storage
+                self.vectorstore = FAISS(
+                    embedding_function=self.embeddings,
+                    index=index,
+                    docstore=ParquetDocstore(self._docs_path),
+                    index_to_docstore_id={i: str(i) for i in range(index.ntotal)},
+                    distance_strategy=self._distance_strategy(index)
                 )
+                self._backfill_seen()
             else:
                 self.vectorstore = None
         except Exception as e:
             print(f"Creating new vector store: {e}")
             self.vectorstore = None
     
-    def add_documents(self, documents: List[Document]) -> bool:
+    def _backfill_seen(self):
         """
-        Add documents to the vector store
-        Returns True if successful
+        Record the hashes of the store's chunks if the seen table is empty
+        Stores saved before the table existed would otherwise take duplicates of chunks they hold
+        """
+        n_vectors = self.vectorstore.index.ntotal
+        if n_vectors == 0 or self._seen.execute("SELECT 1 FROM seen LIMIT 1").fetchone():
+            return
+        
+        docstore = self.vectorstore.docstore
+        rows = []
+        for i in range(n_vectors):
+            doc = docstore.search(str(i))
+            if isinstance(doc, Document):
+                rows.append((self._content_hash(doc.page_content), i))
+        # Keep the first row of chunks the store already holds more than once
+        self._seen.executemany("INSERT OR IGNORE INTO seen (hash, id) VALUES (?, ?)", rows)
+        self._seen.commit()
+    
+    @property
+    def _docs_path(self) -> str:
+        """Parquet file holding the main store's documents"""
+        return os.path.join(FAISS_PERSIST_DIRECTORY, "docs.parquet")
+    
+    def _migrate_pickle_docstore(self, n_vectors: int):
+        """Convert a store saved by FAISS.save_local (pickled docstore) to Parquet"""
+        pickle_path = os.path.join(FAISS_PERSIST_DIRECTORY, "index.pkl")
+        with open(pickle_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        
+        parquet_store = ParquetDocstore(self._docs_path)
+        parquet_store.add({
+            str(i): docstore.search(index_to_docstore_id[i]) for i in range(n_vectors)
+        })
+        parquet_store.save()
+        os.remove(pickle_path)
+    
+    def _save(self):
+        """
+        Persist the main index and its documents
+        Refuses to replace a store saved by another process since this one loaded it:
+        its rows, documents and float16 vectors would no longer line up
+        """
+        if self._index_version() != self._loaded_version:
+            raise RuntimeError("index.faiss was saved by another process since this store loaded it")
+        self._ensure_writable()
+        # Other sessions may have the current file memory-mapped; truncating it under them
+        # would crash the process, so write a new file and swap it in
+        index_path = os.path.join(FAISS_PERSIST_DIRECTORY, "index.faiss")
+        faiss.write_index(self.vectorstore.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        self._loaded_version = self._index_version()
+        self.vectorstore.docstore.save()
+    
+    @staticmethod
+    def _mapped_invlists(index):
+        """The index's inverted lists if they are memory-mapped from disk, else None"""
+        try:
+            ivf = faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return None
+        invlists = faiss.downcast_InvertedLists(ivf.invlists)
+        return invlists if isinstance(invlists, faiss.OnDiskInvertedLists) else None
+    
+    @staticmethod
+    def _index_version():
+        """
+        Identity of index.faiss on disk, or None if there is none
+        Saves swap in a new file, so any session's save changes it
         """
         try:
+            stat = os.stat(os.path.join(FAISS_PERSIST_DIRECTORY, "index.faiss"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def _reload_if_stale(self) -> bool:
+        """
+        Reload the index, documents and id map if another session saved the store since
+        this one loaded it; adding to the old copy would overwrite that session's rows
+        Returns True if the store was reloaded
+        """
+        if self._index_version() == self._loaded_version:
+            return False
+        
+        self.vectorstore = None
+        self.index_spec = None
+        self._index_mmapped = False
+        self._ef_curve = {}
+        self._ef_curve_size = None
+        # The directory may have been cleared and recreated, taking seen.db with it
+        self._seen.close()
+        self._open_seen_db()
+        self._load_or_create_vectorstore()
+        return True
+    
+    def _ensure_writable(self):
+        """Copy a read-only memory-mapped index's inverted lists into memory before modifying it"""
+        if not self._index_mmapped:
+            return
+        
+        index = self.vectorstore.index
+        mapped = self._mapped_invlists(index)
+        in_memory = faiss.ArrayInvertedLists(mapped.nlist, mapped.code_size)
+        for list_no in range(mapped.nlist):
+            size = mapped.list_size(list_no)
+            if size:
+                in_memory.add_entries(list_no, size, mapped.get_ids(list_no), mapped.get_codes(list_no))
+        faiss.extract_index_ivf(index).replace_invlists(in_memory, True)
+        # The index owns the lists now
+        in_memory.this.disown()
+        self._index_mmapped = False
+    
+    def _cache_path(self, key: str) -> str:
+        """Directory holding the index for a single processed file"""
+        return os.path.join(FAISS_PERSIST_DIRECTORY, key)
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts in length-sorted batches that fit the token budget
+        Similar-length chunks share a batch, so little compute is spent on padding
+        """
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+        
+        lengths = [
+            len(ids) for ids in self._tokenizer(
+                texts,
+                truncation=True,
+                max_length=EMBED_MAX_SEQ_LENGTH
+            )["input_ids"]
+        ]
+        order = np.argsort(lengths, kind="stable")
+        
+        # Padded cost of a batch is its size times its longest member
+        batches, batch = [], []
+        for i in order:
+            if batch and (len(batch) + 1) * lengths[i] > EMBED_TOKEN_BUDGET:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        
+        embedded = [
+            np.asarray(self.embeddings.embed_documents([texts[i] for i in batch]), dtype=np.float32)
+            for batch in batches
+        ]
+        
+        # Restore the original chunk order
+        vectors = np.empty((len(texts), embedded[0].shape[1]), dtype=np.float32)
+        for batch, batch_vectors in zip(batches, embedded):
+            vectors[batch] = batch_vectors
+        return vectors
+    
+    def _make_index(self, dim: int, n_vectors: int, index_spec: str = None):
+        """
+        Build the FAISS index for a new store from its factory string
+        (picked from the corpus size unless given)
+        Returns the index and the factory string; callers record the string once the index is in use
+        Embeddings are L2-normalized at encode time, so inner product ranks exactly like
+        cosine similarity and costs one operation less per dimension than L2
+        """
+        index_spec = index_spec or index_factory_string(n_vectors, self.use_int8)
+        index = faiss.index_factory(dim, index_spec, faiss.METRIC_INNER_PRODUCT)
+        
+        if hasattr(index, "nprobe"):
+            index.nprobe = IVF_NPROBE
+        if hasattr(index, "hnsw"):
+            _, ef_construction, _ = auto_tune(n_vectors)
+            index.hnsw.efConstruction = ef_construction
+        return index, index_spec
+    
+    def _train_index(self, index, vectors: np.ndarray):
+        """Train IVF-PQ quantizers, on a random sample for large corpora"""
+        if index.is_trained:
+            return
+        if len(vectors) > IVF_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            vectors = vectors[np.sort(rng.choice(len(vectors), IVF_TRAIN_SAMPLE, replace=False))]
+        index.train(np.asarray(vectors, dtype=np.float32))
+    
+    @property
+    def _spec_path(self) -> str:
+        """Text file holding the index_factory string the main index was built from"""
+        return os.path.join(FAISS_PERSIST_DIRECTORY, "index_factory.txt")
+    
+    @property
+    def _vectors_path(self) -> str:
+        """Raw float16 copy of every vector in the main index, one row per FAISS id"""
+        return os.path.join(FAISS_PERSIST_DIRECTORY, "vectors.f16")
+    
+    def _stored_vectors(self) -> np.ndarray:
+        """Memory-map the float16 vector file as an (n, dim) array"""
+        dim = self.vectorstore.index.d
+        if not os.path.exists(self._vectors_path) or os.path.getsize(self._vectors_path) == 0:
+            return np.empty((0, dim), dtype=np.float16)
+        return np.memmap(self._vectors_path, dtype=np.float16, mode="r").reshape(-1, dim)
+    
+    def _append_vectors(self, start: int, vectors: np.ndarray):
+        """
+        Append newly added vectors to the float16 file
+        Skipped when the file doesn't already cover rows [0, start), e.g. for older stores.
+        Called under _WRITE_LOCK right after _save, so rows [0, start) are this store's own
+        """
+        row_bytes = vectors.shape[1] * np.dtype(np.float16).itemsize
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        if size != start * row_bytes:
+            return
+        with open(self._vectors_path, "ab") as f:
+            f.write(vectors.astype(np.float16).tobytes())
+    
+    @staticmethod
+    def _distance_strategy(index) -> DistanceStrategy:
+        """LangChain scoring mode matching the index metric (older stores are L2)"""
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return DistanceStrategy.MAX_INNER_PRODUCT
+        return DistanceStrategy.EUCLIDEAN_DISTANCE
+    
+    def _uses_inner_product(self) -> bool:
+        """Whether the main index scores by inner product"""
+        return self.vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT
+    
+    def _prepare_search(self, k: int, time_budget_ms: float = None):
+        """
+        Widen the HNSW search beam enough to return k good results
+        With a time budget, use the widest beam measured to fit within it
+        """
+        hnsw = getattr(self.vectorstore.index, "hnsw", None)
+        if hnsw is None:
+            return
+        
+        if time_budget_ms is None:
+            _, _, ef_search = auto_tune(self.vectorstore.index.ntotal)
+            hnsw.efSearch = max(k * 10, ef_search)
+            return
+        
+        # Until the first measurement lands, stay on the cheapest beam
+        self._schedule_ef_curve()
+        curve = self._ef_curve
+        fitting = [ef for ef, latency in curve.items() if latency <= time_budget_ms]
+        ef_search = max(fitting) if fitting else min(EF_SEARCH_CANDIDATES)
+        # HNSW returns at most efSearch results
+        hnsw.efSearch = max(k, ef_search)
+    
+    def _schedule_ef_curve(self):
+        """
+        Measure the efSearch latency curve on the thread pool, so no search waits for it
+        Graph search cost grows slowly with size, so it is re-measured only once the index doubles
+        """
+        index = self.vectorstore.index if self.vectorstore is not None else None
+        if index is None or not hasattr(index, "hnsw") or index.ntotal == 0:
+            return
+        if self._ef_curve_size is not None and index.ntotal < 2 * self._ef_curve_size:
+            return
+        if self._ef_future is not None and not self._ef_future.done() and self._ef_index is index:
+            return
+        self._ef_index = index
+        self._ef_future = self._pool.submit(self._measure_ef_curve, index)
+    
+    def _finish_ef_curve(self):
+        """
+        Cancel or wait out a pending latency measurement before the index is modified
+        FAISS HNSW doesn't support adding vectors while another thread searches the graph
+        """
+        if self._ef_future is not None:
+            self._ef_future.cancel()
+            wait([self._ef_future])
+    
+    def _measure_ef_curve(self, index):
+        """Time single-query searches at each candidate efSearch, using stored vectors as queries"""
+        try:
+            rng = np.random.default_rng(0)
+            n_queries = min(EF_BENCHMARK_QUERIES, index.ntotal)
+            ids = rng.choice(index.ntotal, n_queries, replace=False)
+            queries = np.stack([index.reconstruct(int(i)) for i in ids])
+            
+            curve = {}
+            for ef in EF_SEARCH_CANDIDATES:
+                # Per-call parameters leave the shared index's efSearch untouched
+                params = faiss.SearchParametersHNSW(efSearch=ef)
+                timings = []
+                for query in queries:
+                    start = time.perf_counter()
+                    index.search(query[None, :], 10, params=params)
+                    timings.append((time.perf_counter() - start) * 1000)
+                curve[ef] = float(np.median(timings))
+            
+            # Drop the result if the index was replaced or cleared meanwhile
+            if self.vectorstore is not None and self.vectorstore.index is index:
+                self._ef_curve = curve
+                self._ef_curve_size = index.ntotal
+        except Exception as e:
+            print(f"Could not measure search latency: {e}")
+    
+    def _add_embeddings(self, texts: List[str], vectors, metadatas: List[dict]):
+        """Add pre-computed embeddings to the main store and persist it"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with _WRITE_LOCK:
+            self._finish_ef_curve()
+            if self._reload_if_stale():
+                # The other session may have added some of these chunks itself
+                keep = self._unseen(texts)
+                if not keep:
+                    return
+                texts = [texts[i] for i in keep]
+                vectors = vectors[keep]
+                metadatas = [metadatas[i] for i in keep]
+            
             if self.vectorstore is None:
-                # Create new vectorstore
-                self.vectorstore = FAISS.from_documents(
-                    documents=documents,
-                    embedding=self.embeddings
+                index, index_spec = self._make_index(vectors.shape[1], len(vectors))
+                self._train_index(index, vectors)
+                self.index_spec = index_spec
+                with open(self._spec_path, "w") as f:
+                    f.write(index_spec)
+                # Don't pick up documents or vectors left over from an unreadable store
+                for path in (self._docs_path, self._vectors_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._seen.execute("DELETE FROM seen")
+                self.vectorstore = FAISS(
+                    embedding_function=self.embeddings,
+                    index=index,
+                    docstore=ParquetDocstore(self._docs_path),
+                    index_to_docstore_id={},
+                    distance_strategy=self._distance_strategy(index)
                 )
             else:
-                # Add to existing vectorstore
-                self.vectorstore.add_documents(documents)
+                self._ensure_writable()
+            
+            # Docstore ids follow FAISS row numbers
+            start = self.vectorstore.index.ntotal
+            self.vectorstore.add_embeddings(
+                list(zip(texts, vectors)),
+                metadatas=metadatas,
+                ids=[str(start + i) for i in range(len(texts))]
+            )
+            self._save()
+            self._append_vectors(start, vectors)
+            
+            self._seen.executemany(
+                "INSERT OR REPLACE INTO seen (hash, id) VALUES (?, ?)",
+                [(self._content_hash(text), start + i) for i, text in enumerate(texts)]
+            )
+            self._seen.commit()
+            
+            # Quantizers are trained once, so when the corpus outgrows the index picked for it,
+            # rebuild from the stored vectors (indexes given to rebuild_index are left alone)
+            n_vectors = self.vectorstore.index.ntotal
+            if (self.index_spec == index_factory_string(start, self.use_int8)
+                    and self.index_spec != index_factory_string(n_vectors, self.use_int8)):
+                self.rebuild_index()
+    
+    def rebuild_index(self, index_spec: str = None) -> bool:
+        """
+        Rebuild the main index from the stored float16 vectors, without re-running the encoder
+        index_spec is a FAISS index_factory string; defaults to the one picked for the corpus size
+        Returns False if there is no store or its vectors weren't recorded
+        """
+        with _WRITE_LOCK:
+            # Rebuild from the current store, including rows other sessions have added
+            self._reload_if_stale()
+            if self.vectorstore is None:
+                return False
             
-            # Persist changes
-            self.vectorstore.save_local(FAISS_PERSIST_DIRECTORY)
+            try:
+                stored = self._stored_vectors()
+                n_vectors = self.vectorstore.index.ntotal
+                if len(stored) != n_vectors:
+                    print(f"Cannot rebuild index: {len(stored)} of {n_vectors} vectors stored")
+                    return False
+                
+                index, index_spec = self._make_index(stored.shape[1], n_vectors, index_spec)
+                self._train_index(index, stored)
+                # Convert to float32 a slice at a time to keep peak memory low
+                for start in range(0, n_vectors, 10_000):
+                    index.add(np.asarray(stored[start:start + 10_000], dtype=np.float32))
+                
+                # Row order is unchanged, so documents and the id map carry over as they are
+                self.vectorstore.index = index
+                self.vectorstore.distance_strategy = self._distance_strategy(index)
+                # Only now that the new index is installed does the spec describe it
+                self.index_spec = index_spec
+                self._index_mmapped = False
+                self._ef_curve_size = None
+                self._save()
+                with open(self._spec_path, "w") as f:
+                    f.write(index_spec)
+                return True
+            except Exception as e:
+                print(f"Error rebuilding index: {e}")
+                return False
+    
+    def load(self, key: str) -> bool:
+        """
+        Add a previously processed file, saved under its content hash, to the vector store
+        Returns False if no index exists for that key
+        """
+        path = self._cache_path(key)
+        if not os.path.exists(os.path.join(path, "index.faiss")):
+            return False
+        
+        try:
+            store = FAISS.load_local(
+                path,
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+            
+            # Per-file indexes are flat, so their vectors can be read back exactly
+            docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+            keep = self._unseen([doc.page_content for doc in docs])
+            if keep:
+                vectors = store.index.reconstruct_n(0, store.index.ntotal)
+                self._add_embeddings(
+                    [docs[i].page_content for i in keep],
+                    vectors[keep],
+                    [docs[i].metadata for i in keep]
+                )
+            return True
+        except Exception as e:
+            print(f"Error loading cached index {key}: {e}")
+            return False
+    
+    def _file_vectors(self, texts: List[str], keep: List[int], vectors: np.ndarray) -> np.ndarray:
+        """
+        Vectors for every chunk of a file, given the embeddings of the kept ones (keep)
+        Chunks skipped as already stored take their vectors from the main store
+        """
+        hashes = [self._content_hash(text) for text in texts]
+        by_hash = {hashes[i]: vector for i, vector in zip(keep, vectors)}
+        
+        missing = list(dict.fromkeys(h for h in hashes if h not in by_hash))
+        if missing:
+            stored = self._stored_rows(missing)
+            rows = [stored[h] for h in missing]
+            try:
+                reused = self._vectors_at(rows)
+            except RuntimeError:
+                # IVF indexes without the float16 file can't reconstruct their rows
+                text_by_hash = dict(zip(hashes, texts))
+                reused = self._embed_texts([text_by_hash[h] for h in missing])
+            by_hash.update(zip(missing, reused))
+        
+        return np.stack([by_hash[h] for h in hashes])
+    
+    def _vectors_at(self, rows: List[int]) -> np.ndarray:
+        """Float32 vectors of main-index rows, from the float16 file or else the index itself"""
+        with _WRITE_LOCK:
+            # The file only describes this store's rows until another session saves
+            if self._index_version() == self._loaded_version:
+                stored = self._stored_vectors()
+                if len(stored) == self.vectorstore.index.ntotal:
+                    return np.asarray(stored[rows], dtype=np.float32)
+        return np.stack([self.vectorstore.index.reconstruct(int(row)) for row in rows])
+    
+    def add_documents(self, documents: List[Document], key: str = None) -> bool:
+        """
+        Add documents to the vector store
+        Chunks already in the store are skipped before embedding.
+        If key is given, an index of all the documents is also saved under it for load()
+        Returns True if successful
+        """
+        try:
+            if not documents:
+                return True
+            
+            texts = [doc.page_content for doc in documents]
+            keep = self._unseen(texts)
+            vectors = self._embed_texts([texts[i] for i in keep]) if keep else []
+            
+            if key:
+                # Save every chunk, not just the new ones: load() may add this file to a
+                # store that has never seen the chunks skipped here
+                FAISS.from_embeddings(
+                    text_embeddings=list(zip(texts, self._file_vectors(texts, keep, vectors))),
+                    embedding=self.embeddings,
+                    metadatas=[doc.metadata for doc in documents]
+                ).save_local(self._cache_path(key))
+            
+            # Add to the main vectorstore and persist changes
+            if keep:
+                self._add_embeddings(
+                    [texts[i] for i in keep],
+                    vectors,
+                    [documents[i].metadata for i in keep]
+                )
             return True
             
         except Exception as e:
             print(f"Error adding documents: {e}")
             return False
     
-    def similarity_search(self, query: str, k: int = 3) -> List[Document]:
+    def similarity_search(self, query: str, k: int = 3, time_budget_ms: float = None) -> List[Document]:
         """
         Search for similar documents based on query
+        time_budget_ms trades recall for latency on HNSW indexes
         Returns top k most relevant document chunks
         """
         if self.vectorstore is None:
             return []
         
         try:
-            results = self.vectorstore.similarity_search(query, k=k)
+            self._prepare_search(k, time_budget_ms)
+            results = self.vectorstore.similarity_search_by_vector(list(self._embed_query(query)), k=k)
             return results
         except Exception as e:
             print(f"Error during similarity search: {e}")
             return []
     
-    def similarity_search_with_score(self, query: str, k: int = 3) -> List[tuple]:
+    async def asimilarity_search(self, query: str, k: int = 3, time_budget_ms: float = None) -> List[Document]:
+        """Async version of similarity_search that runs the search on a worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self.similarity_search, query, k, time_budget_ms)
+    
+    def batch_similarity_search(self, queries: List[str], k: int = 3) -> List[List[Document]]:
+        """
+        Search for several queries at once
+        The queries are embedded in one forward pass and searched in one FAISS call,
+        which spreads the queries across cores
+        Returns one list of top k documents per query
+        """
+        if self.vectorstore is None or not queries:
+            return [[] for _ in queries]
+        
+        try:
+            vectors = np.asarray(self.embeddings.embed_documents(queries), dtype=np.float32)
+            self._prepare_search(k)
+            _, indices = self.vectorstore.index.search(vectors, k)
+        
+            docstore = self.vectorstore.docstore
+            id_map = self.vectorstore.index_to_docstore_id
+            # FAISS pads with -1 when fewer than k results exist
+            return [
+                [docstore.search(id_map[i]) for i in row if i != -1]
+                for row in indices
+            ]
+        except Exception as e:
+            print(f"Error during batch similarity search: {e}")
+            return [[] for _ in queries]
+
+    def similarity_search_with_score(self, query: str, k: int = 3, time_budget_ms: float = None) -> List[tuple]:
         """
         Search with relevance scores
-        Returns list of (Document, score) tuples
+        Returns list of (Document, score) tuples; lower scores are closer
+        (cosine distance for inner-product indexes, squared L2 for older ones)
         """
         if self.vectorstore is None:
             return []
         
         try:
-            results = self.vectorstore.similarity_search_with_score(query, k=k)
+            self._prepare_search(k, time_budget_ms)
+            results = self.vectorstore.similarity_search_with_score_by_vector(
+                list(self._embed_query(query)),
+                k=k
+            )
+            if self._uses_inner_product():
+                results = [(doc, 1.0 - score) for doc, score in results]
             return results
         except Exception as e:
             print(f"Error during similarity search with score: {e}")
             return []
     
+    def similarity_search_reranked(self, query: str, k: int = 3, fetch_k: int = 20) -> List[Document]:
+        """
+        Fetch fetch_k candidates, then return the k best after a chunk-length penalty
+        """
+        results = self.similarity_search_with_score(query, k=max(k, fetch_k))
+        if not results:
+            return []
+        
+        docs = [doc for doc, _ in results]
+        distances = np.array([score for _, score in results])
+        if self._uses_inner_product():
+            similarities = 1.0 - distances
+        else:
+            # Squared L2 distance between unit vectors -> cosine similarity
+            similarities = 1.0 - distances / 2.0
+        lengths = np.array([len(doc.page_content) for doc in docs])
+        
+        scores = rerank(similarities, lengths, RERANK_LENGTH_PENALTY)
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [docs[i] for i in best]
+    
     def clear_vectorstore(self):
         """Clear all documents from the vector store"""
         try:
             self.vectorstore = None
+            self.index_spec = None
+            self._index_mmapped = False
+            self._ef_curve = {}
+            self._ef_curve_size = None
             
             # Clear the persist directory
             import shutil
-            if os.path.exists(FAISS_PERSIST_DIRECTORY):
-                shutil.rmtree(FAISS_PERSIST_DIRECTORY)
-                os.makedirs(FAISS_PERSIST_DIRECTORY, exist_ok=True)
+            with _WRITE_LOCK:
+                self._seen.close()
+                if os.path.exists(FAISS_PERSIST_DIRECTORY):
+                    shutil.rmtree(FAISS_PERSIST_DIRECTORY)
+                    os.makedirs(FAISS_PERSIST_DIRECTORY, exist_ok=True)
+                self._open_seen_db()
+                self._loaded_version = None
             
             return True
         except Exception as e:
@@ -0,0 +1,58 @@
+"""
+Round-trip checks for the Parquet docstore
+"""
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("langchain_community")
+
+from langchain_community.docstore.base import AddableMixin
+from langchain_core.documents import Document
+from src.docstore import ParquetDocstore
+
+
+def test_docstore_is_addable(tmp_path):
+    # LangChain's FAISS refuses to add texts to docstores without AddableMixin
+    assert isinstance(ParquetDocstore(str(tmp_path / "docs.parquet")), AddableMixin)
+
+
+def test_add_save_reopen_search(tmp_path):
+    path = str(tmp_path / "docs.parquet")
+    store = ParquetDocstore(path)
+    store.add({
+        "0": Document(page_content="first", metadata={"page": 1}),
+        "1": Document(page_content="second", metadata={"page": 2})
+    })
+    store.save()
+    store.add({"2": Document(page_content="third", metadata={})})
+    store.save()
+
+    reopened = ParquetDocstore(path)
+    assert len(reopened) == 3
+    assert reopened.search("0").page_content == "first"
+    assert reopened.search("1").metadata == {"page": 2}
+    assert reopened.search("2").page_content == "third"
+    assert reopened.search("3") == "ID 3 not found."
+
+
+def test_save_keeps_own_rows_after_another_store_saves(tmp_path):
+    path = str(tmp_path / "docs.parquet")
+    seed = ParquetDocstore(path)
+    seed.add({"0": Document(page_content="shared", metadata={})})
+    seed.save()
+
+    mine, theirs = ParquetDocstore(path), ParquetDocstore(path)
+    theirs.add({"1": Document(page_content="theirs", metadata={})})
+    theirs.save()
+    mine.add({"1": Document(page_content="mine", metadata={})})
+    mine.save()
+
+    assert mine.search("0").page_content == "shared"
+    assert mine.search("1").page_content == "mine"
+
+
+def test_save_rejects_ids_that_skip_rows(tmp_path):
+    store = ParquetDocstore(str(tmp_path / "docs.parquet"))
+    store.add({"1": Document(page_content="gap", metadata={})})
+    with pytest.raises(ValueError):
+        store.save()
@@ -0,0 +1,63 @@
+"""
+Chunking checks for DocumentProcessor._fast_chunk
+"""
+import pytest
+
+pytest.importorskip("pdfplumber")
+pytest.importorskip("PyPDF2")
+
+from src.config import CHUNK_SIZE
+from src.document_processor import DocumentProcessor
+
+
+def _words(n: int) -> str:
+    # Distinct words, so every chunk's position in the text is unambiguous
+    return " ".join(f"w{i}" for i in range(n))
+
+
+def test_chunks_fit_chunk_size():
+    text = "\n\n".join(_words(300) for _ in range(5))
+    chunks = DocumentProcessor()._fast_chunk(text)
+    assert len(chunks) > 1
+    assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE
+
+
+def test_overlap_starts_after_a_separator():
+    processor = DocumentProcessor()
+    text = _words(2000)
+    chunks = processor._fast_chunk(text)
+
+    prev_end = None
+    for chunk in chunks:
+        start = text.index(chunk)
+        if prev_end is not None:
+            assert text[start - 1] == " "
+            assert start < prev_end
+            assert prev_end - start <= processor.chunk_overlap
+        prev_end = start + len(chunk)
+    assert prev_end == len(text)
+
+
+def test_text_without_separators_is_hard_cut():
+    text = "x" * (2 * CHUNK_SIZE + 500)
+    chunks = DocumentProcessor()._fast_chunk(text)
+    assert [len(chunk) for chunk in chunks] == [CHUNK_SIZE, CHUNK_SIZE, 500]
+    assert "".join(chunks) == text
+
+
+@pytest.mark.parametrize("text", ["", " ", "\n\n \n", " " * (3 * CHUNK_SIZE)])
+def test_blank_text_gives_no_chunks(text):
+    assert DocumentProcessor()._fast_chunk(text) == []
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(1, 0), (2, 1), (5, 4), (10, 10), (10, 50)])
+@pytest.mark.parametrize("text", ["a b", "  a  ", "ab\n\ncd", "x" * 40, "a " * 40, " \n" * 40])
+def test_chunking_terminates_and_keeps_all_words(text, chunk_size, chunk_overlap):
+    processor = DocumentProcessor()
+    processor.chunk_size, processor.chunk_overlap = chunk_size, chunk_overlap
+    # Each chunk advances by at least one character, so there can't be more chunks than characters
+    chunks = processor._fast_chunk(text)
+    assert len(chunks) <= len(text)
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    for word in text.split():
+        assert any(word in chunk for chunk in chunks) or len(word) > chunk_size
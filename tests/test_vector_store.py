@@ -0,0 +1,85 @@
+"""
+Checks for sessions sharing one persisted vector store
+"""
+import hashlib
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("pyarrow")
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_huggingface")
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import src.vector_store as vector_store
+
+DIM = 32
+
+
+def _vector(text: str) -> list:
+    seed = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _HashEmbeddings(Embeddings):
+    """Deterministic unit vectors, one per distinct text"""
+
+    def embed_documents(self, texts):
+        return [_vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return _vector(text)
+
+
+class _WordTokenizer:
+    """Stands in for the MiniLM tokenizer used to batch chunks by length"""
+
+    def __call__(self, texts, **kwargs):
+        return {"input_ids": [text.split() for text in texts]}
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "FAISS_PERSIST_DIRECTORY", str(tmp_path))
+
+    def make():
+        store = vector_store.VectorStoreManager(embeddings=_HashEmbeddings())
+        store._tokenizer = _WordTokenizer()
+        return store
+
+    return make
+
+
+def _docs(*texts):
+    return [Document(page_content=text, metadata={}) for text in texts]
+
+
+def test_rebuild_after_interleaved_sessions_keeps_vectors_with_their_rows(manager):
+    assert manager().add_documents(_docs(*(f"seed chunk {i}" for i in range(20))))
+
+    # Both sessions load the same store before either adds
+    a, b = manager(), manager()
+    assert a.add_documents(_docs("alpha"))
+    assert b.add_documents(_docs("beta"))
+    assert b.vectorstore.index.ntotal == 22
+    assert b.rebuild_index("Flat")
+
+    for session in (b, manager()):
+        assert session.similarity_search("alpha", k=1)[0].page_content == "alpha"
+        assert session.similarity_search("beta", k=1)[0].page_content == "beta"
+
+
+def test_stale_session_skips_chunks_another_session_added(manager):
+    assert manager().add_documents(_docs("seed"))
+
+    a, b = manager(), manager()
+    assert a.add_documents(_docs("shared", "alpha"))
+    assert b.add_documents(_docs("shared", "beta"))
+
+    texts = [
+        b.vectorstore.docstore.search(str(i)).page_content
+        for i in range(b.vectorstore.index.ntotal)
+    ]
+    assert sorted(texts) == ["alpha", "beta", "seed", "shared"]